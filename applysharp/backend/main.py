@@ -6,22 +6,28 @@ Fix: Robust JSON extraction, simplified prompts, better error handling
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Form, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import google.generativeai as genai
 from tavily import TavilyClient
-import pdfplumber
-import io
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+import fitz  # PyMuPDF
+import asyncio
+import hashlib
+import hmac
 import os
 import time
 import uuid
-import json
+import orjson
 import re
-from collections import defaultdict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 # ─────────────────────────────────────────────
 # APP SETUP
 # ─────────────────────────────────────────────
-app = FastAPI(docs_url=None, redoc_url=None)
+app = FastAPI(docs_url=None, redoc_url=None, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,15 +40,25 @@ app.add_middleware(
 # ─────────────────────────────────────────────
 # SECURITY & RATE LIMITING
 # ─────────────────────────────────────────────
-request_log: dict = defaultdict(list)
+request_log: OrderedDict = OrderedDict()
 
 MAX_PER_HOUR     = 3
 MAX_PER_DAY      = 8
 MAX_FILE_SIZE    = 5 * 1024 * 1024
 MAX_JD_LENGTH    = 8000
 MAX_FIELD_LENGTH = 300
+MAX_PDF_PAGES    = 40
+MAX_PDF_CHARS    = 20000
+MAX_TRACKED_IPS  = 100_000
+
+# Prompt budgets (chars) — inputs are cut to these once, before prompts and sessions
+PROMPT_JD_CHARS    = 2500
+PROMPT_CV_CHARS    = 2500
+PROMPT_LI_CHARS    = 1500
+PROMPT_INTEL_CHARS = 2000
 
 APP_PASSWORD = os.getenv("APP_PASSWORD", "changeme")
+_APP_PW      = APP_PASSWORD.strip().encode()
 
 
 def get_ip(request: Request) -> str:
@@ -52,20 +68,87 @@ def get_ip(request: Request) -> str:
     return (request.client.host if request.client else None) or "unknown"
 
 
-def check_rate_limit(ip: str):
+# Trim, count and reserve in one atomic call, so parallel requests on
+# different workers can't all pass the check before any of them records
+_RATE_LIMIT_LUA = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - 86400)
+if redis.call('ZCOUNT', KEYS[1], '(' .. (now - 3600), '+inf') >= tonumber(ARGV[2]) then
+  return 1
+end
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+  return 2
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('EXPIRE', KEYS[1], 86400)
+return 0
+"""
+
+
+async def check_rate_limit(ip: str):
+    """Returns (limited, msg, slot). When not limited, the request is already
+    counted; pass slot to release_rate_limit to un-count it."""
     now = time.time()
-    request_log[ip] = [t for t in request_log[ip] if now - t < 86400]
-    hour_count = sum(1 for t in request_log[ip] if now - t < 3600)
-    day_count  = len(request_log[ip])
-    if hour_count >= MAX_PER_HOUR:
-        return True, f"Max {MAX_PER_HOUR} analyses per hour. Try again soon."
-    if day_count >= MAX_PER_DAY:
-        return True, f"Daily limit of {MAX_PER_DAY} reached. Come back tomorrow."
-    return False, ""
+    r   = get_redis()
+    if r is not None:
+        slot = uuid.uuid4().hex
+        try:
+            status = await r.eval(_RATE_LIMIT_LUA, 1, f"rl:{ip}", now, MAX_PER_HOUR, MAX_PER_DAY, slot)
+        except RedisError:
+            # Fail closed — the limiter is what caps AI and search spend
+            raise HTTPException(503, "Rate limiter unavailable. Please try again in a minute.")
+    else:
+        # Timestamps are appended in order, so expired ones are always at the front
+        slot = now
+        dq   = request_log.get(ip, deque())
+        while dq and now - dq[0] >= 86400:
+            dq.popleft()
+        if not dq:
+            request_log.pop(ip, None)
+        else:
+            # Every check counts as a use, so throttled IPs stay tracked
+            request_log.move_to_end(ip)
+        if sum(1 for t in dq if now - t < 3600) >= MAX_PER_HOUR:
+            status = 1
+        elif len(dq) >= MAX_PER_DAY:
+            status = 2
+        else:
+            status = 0
+            _record_local(ip, now)
+    if status == 1:
+        return True, f"Max {MAX_PER_HOUR} analyses per hour. Try again soon.", None
+    if status == 2:
+        return True, f"Daily limit of {MAX_PER_DAY} reached. Come back tomorrow.", None
+    return False, "", slot
+
+
+def _record_local(ip: str, now: float):
+    dq = request_log.get(ip)
+    if dq is None:
+        dq = request_log[ip] = deque()
+    request_log.move_to_end(ip)
+    dq.append(now)
+    # Least-recently-seen IPs go first; losing their history only relaxes their limit
+    while len(request_log) > MAX_TRACKED_IPS:
+        request_log.popitem(last=False)
+
+
+async def release_rate_limit(ip: str, slot):
+    r = get_redis()
+    if r is not None:
+        try:
+            await r.zrem(f"rl:{ip}", slot)
+        except RedisError:
+            pass  # best-effort — don't mask the caller's real error
+        return
+    dq = request_log.get(ip)
+    if dq and slot in dq:
+        dq.remove(slot)
 
 
 def verify_password(pwd: str) -> bool:
-    return str(pwd).strip() == str(APP_PASSWORD).strip()
+    # Constant-time compare so response timing doesn't leak the password
+    return hmac.compare_digest(str(pwd).strip().encode(), _APP_PW)
 
 
 def sanitize(text: str, max_len: int) -> str:
@@ -77,16 +160,71 @@ def sanitize(text: str, max_len: int) -> str:
 # ─────────────────────────────────────────────
 sessions: dict = {}
 SESSION_TTL = 3600
+INTEL_TTL   = 86400
 
+_session_secret = None
 
-def create_session(data: dict) -> str:
-    _cleanup_sessions()
-    sid = str(uuid.uuid4())
-    sessions[sid] = {"data": data, "created_at": time.time()}
+
+def get_session_secret() -> bytes:
+    """Token signing key. Never derived from APP_PASSWORD — tokens would become an
+    offline brute-force oracle for it."""
+    global _session_secret
+    if _session_secret is None:
+        key = os.getenv("SESSION_SECRET", "")
+        if key:
+            _session_secret = key.encode()
+        elif os.getenv("REDIS_URL"):
+            # Several workers must verify each other's tokens, so they need a shared key
+            raise HTTPException(500, "SESSION_SECRET not set in Railway variables (required with REDIS_URL).")
+        else:
+            # Single worker with in-memory sessions — a per-process random key is enough
+            _session_secret = os.urandom(32)
+    return _session_secret
+
+
+def _sign(payload: str) -> str:
+    return hmac.new(get_session_secret(), payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def _session_token(sid: str, expiry: int) -> str:
+    payload = f"{sid}.{expiry:x}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def _verify_token(token: str):
+    """Session id for an authentic, unexpired token — otherwise None."""
+    try:
+        sid, expiry_hex, mac = str(token).split(".")
+        expiry = int(expiry_hex, 16)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(mac.encode(), _sign(f"{sid}.{expiry_hex}").encode()):
+        return None
+    if time.time() > expiry:
+        return None
     return sid
 
 
-def get_session(sid: str):
+async def create_session(data: dict) -> str:
+    sid = str(uuid.uuid4())
+    r   = get_redis()
+    if r is not None:
+        # Redis expires the key itself — no sweep needed
+        await r.set(f"sess:{sid}", orjson.dumps(data), ex=SESSION_TTL)
+    else:
+        _cleanup_sessions()
+        sessions[sid] = {"data": data, "created_at": time.time()}
+    return _session_token(sid, int(time.time()) + SESSION_TTL)
+
+
+async def get_session(token: str):
+    sid = _verify_token(token)
+    if sid is None:
+        return None
+    r = get_redis()
+    if r is not None:
+        raw = await r.get(f"sess:{sid}")
+        return orjson.loads(raw) if raw else None
     s = sessions.get(sid)
     if not s:
         return None
@@ -96,6 +234,17 @@ def get_session(sid: str):
     return s["data"]
 
 
+async def delete_session(token: str):
+    sid = _verify_token(token)
+    if sid is None:
+        return
+    r = get_redis()
+    if r is not None:
+        await r.delete(f"sess:{sid}")
+    else:
+        sessions.pop(sid, None)
+
+
 def _cleanup_sessions():
     now  = time.time()
     dead = [k for k, v in sessions.items() if now - v["created_at"] > SESSION_TTL]
@@ -108,6 +257,7 @@ def _cleanup_sessions():
 # ─────────────────────────────────────────────
 _gemini_model = None
 _tavily       = None
+_redis        = None
 
 
 def get_gemini():
@@ -137,15 +287,51 @@ def get_tavily():
     return _tavily
 
 
+def get_redis():
+    """Shared Redis client, or None to fall back to in-process state."""
+    global _redis
+    if _redis is None:
+        url = os.getenv("REDIS_URL", "")
+        if not url:
+            return None
+        _redis = aioredis.from_url(url)
+    return _redis
+
+
 # ─────────────────────────────────────────────
 # PDF PARSING
 # ─────────────────────────────────────────────
+# PyMuPDF must not be used from several threads at once, so all parsing runs on
+# one dedicated thread. Queued parses wait here, not in the default executor
+# that the Tavily searches use.
+_PDF_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf")
+
+
+async def read_upload(upload: UploadFile, label: str = "file") -> bytearray:
+    """Read in chunks and reject as soon as the size cap is crossed.
+    Returns the buffer itself — fitz accepts a bytearray, so no second copy."""
+    buf = bytearray()
+    while chunk := await upload.read(64 * 1024):
+        buf += chunk
+        if len(buf) > MAX_FILE_SIZE:
+            raise HTTPException(400, f"{label} exceeds 5 MB.")
+    return buf
+
+
 def parse_pdf(file_bytes: bytes, label: str = "file") -> str:
     try:
-        with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-            text = "\n".join(
-                page.extract_text() or "" for page in pdf.pages
-            ).strip()
+        with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+            if doc.page_count > MAX_PDF_PAGES:
+                raise HTTPException(400, f"{label} is too long (max {MAX_PDF_PAGES} pages).")
+            # Prompts only use the first few thousand chars — stop once we have plenty
+            parts, total = [], 0
+            for page in doc:
+                page_text = page.get_text("text")
+                parts.append(page_text)
+                total += len(page_text)
+                if total >= MAX_PDF_CHARS:
+                    break
+            text = "\n".join(parts).strip()
         if not text or len(text) < 30:
             raise HTTPException(
                 400,
@@ -160,35 +346,69 @@ def parse_pdf(file_bytes: bytes, label: str = "file") -> str:
         raise HTTPException(400, f"Failed to parse {label}: {str(e)}")
 
 
+async def parse_pdf_async(file_bytes: bytes, label: str = "file", optional: bool = False) -> str:
+    """Parse on the PDF thread so the event loop stays free. Optional files yield "" instead of raising."""
+    if optional and not file_bytes:
+        return ""
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_PDF_EXECUTOR, parse_pdf, file_bytes, label)
+    except HTTPException:
+        if optional:
+            return ""
+        raise
+
+
 # ─────────────────────────────────────────────
 # INTELLIGENCE GATHERING
 # ─────────────────────────────────────────────
-def gather_intelligence(company: str, role: str, location: str) -> dict:
-    searches = [
-        ("container_a",  f"ATS resume tips {role} hiring manager advice 2025"),
-        ("container_b",  f"{company} hiring culture resume tips recruiter {location}"),
-        ("container_c",  f"{role} resume best practices skills {location} requirements"),
-        ("company_tips", f"{company} recruiter hiring manager LinkedIn resume advice"),
-    ]
-    results = {}
-    for key, query in searches:
-        try:
-            r = get_tavily().search(query=query, max_results=3)
-            results[key] = r.get("results", [])
-        except Exception:
-            results[key] = []
-    return results
+_SEARCH_TEMPLATES = (
+    ("container_a",  "ATS resume tips {role} hiring manager advice 2025"),
+    ("container_b",  "{company} hiring culture resume tips recruiter {location}"),
+    ("container_c",  "{role} resume best practices skills {location} requirements"),
+    ("company_tips", "{company} recruiter hiring manager LinkedIn resume advice"),
+)
+
+_INTEL_LABELS = (
+    ("container_a",  "ATS & Resume Science"),
+    ("container_b",  "Company Intelligence"),
+    ("container_c",  "Role Intelligence"),
+    ("company_tips", "Company-Specific Tips"),
+)
+
+
+def _search(query: str) -> list:
+    r = get_tavily().search(query=query, max_results=3)
+    return r.get("results", [])
+
+
+def _intel_key(company: str, role: str, location: str) -> str:
+    raw = "|".join(v.strip().lower() for v in (company, role, location))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+async def gather_intelligence(company: str, role: str, location: str) -> tuple[dict, bool]:
+    """Returns (results, complete); complete is False if any search failed."""
+    # Tavily client is sync — fan the searches out to worker threads
+    responses = await asyncio.gather(
+        *(
+            asyncio.to_thread(_search, tmpl.format(company=company, role=role, location=location))
+            for _, tmpl in _SEARCH_TEMPLATES
+        ),
+        return_exceptions=True,
+    )
+    results, complete = {}, True
+    for (key, _), resp in zip(_SEARCH_TEMPLATES, responses):
+        if isinstance(resp, BaseException):
+            results[key], complete = [], False
+        else:
+            results[key] = resp
+    return results, complete
 
 
 def format_intel(intel: dict) -> str:
-    labels = {
-        "container_a":  "ATS & Resume Science",
-        "container_b":  "Company Intelligence",
-        "container_c":  "Role Intelligence",
-        "company_tips": "Company-Specific Tips",
-    }
     lines = []
-    for key, label in labels.items():
+    for key, label in _INTEL_LABELS:
         items = intel.get(key, [])
         if items:
             lines.append(f"\n=== {label} ===")
@@ -197,44 +417,131 @@ def format_intel(intel: dict) -> str:
     return "\n".join(lines)
 
 
+async def get_intel_summary(company: str, role: str, location: str) -> str:
+    """Formatted intel, cached so a hit skips both the searches and format_intel.
+    Only this string is cached — the raw results are never needed on a hit."""
+    r   = get_redis()
+    # Budget is part of the key, so changing PROMPT_INTEL_CHARS never serves stale-length entries
+    key = f"intelfmt:{PROMPT_INTEL_CHARS}:{_intel_key(company, role, location)}"
+    if r is not None:
+        try:
+            cached = await r.get(key)
+            if cached:
+                return cached.decode()
+        except RedisError:
+            pass  # cache is best-effort — treat as a miss
+    intel, complete = await gather_intelligence(company, role, location)
+    summary = format_intel(intel)[:PROMPT_INTEL_CHARS]
+    # Only cache when every search succeeded — a degraded summary would stick for a day
+    if r is not None and complete and summary:
+        try:
+            await r.set(key, summary, ex=INTEL_TTL)
+        except RedisError:
+            pass
+    return summary
+
+
 # ─────────────────────────────────────────────
 # AI CALL + ROBUST JSON EXTRACTION
 # ─────────────────────────────────────────────
-def call_ai(prompt: str) -> str:
+def build_context(ctx: dict) -> str:
+    """Application context shared by both prompts. It is sent first and
+    byte-identical on both calls so Gemini's implicit prefix cache can reuse it."""
+    return f"""COMPANY: {ctx['company']}
+ROLE: {ctx['role']}
+LOCATION: {ctx['location']}
+
+JOB DESCRIPTION:
+{ctx['job_description']}
+
+CANDIDATE CV:
+{ctx['cv_text']}
+
+LINKEDIN PROFILE:
+{ctx['linkedin_text'] or "Not provided"}
+
+MARKET INTELLIGENCE:
+{ctx['intel_summary']}
+"""
+
+
+async def call_ai(context: str, instructions: str) -> str:
     model    = get_gemini()
-    response = model.generate_content(prompt)
+    response = await model.generate_content_async([context, instructions])
     return response.text
 
 
+_FENCE_RE          = re.compile(r"```(?:json)?\s*")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def _first_json_object(text: str) -> str:
+    """Single pass from the first '{' to its matching '}', skipping braces inside strings."""
+    start = text.find("{")
+    if start == -1:
+        return ""
+    depth, in_str, escaped = 0, False, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_str:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i+1]
+    # Unbalanced (e.g. truncated output) — hand back the tail for step 4 to try
+    return text[start:]
+
+
 def extract_json(text: str) -> dict:
     if not text:
         return {}
 
-    # Step 1 — strip markdown fences
-    text = re.sub(r"```json\s*", "", text)
-    text = re.sub(r"```\s*",     "", text)
-    text = text.strip()
+    # Step 1 — Gemini is in JSON mode, so the raw reply almost always parses as-is
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        pass
 
-    # Step 2 — try parsing the whole thing directly
+    # Step 2 — strip markdown fences and retry
+    text = _FENCE_RE.sub("", text).strip()
     try:
-        return json.loads(text)
-    except json.JSONDecodeError:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
         pass
 
-    # Step 3 — find the outermost { ... } block
+    # Step 3 — find the outermost { ... } block (C-level find/rfind first)
     start = text.find("{")
     end   = text.rfind("}")
-    if start != -1 and end != -1 and end > start:
+    if start == -1:
+        return {}
+    if end > start:
         try:
-            return json.loads(text[start:end+1])
-        except json.JSONDecodeError:
+            return orjson.loads(text[start:end+1])
+        except orjson.JSONDecodeError:
             pass
 
+    # Step 3b — slower brace-matching scan, for replies with braces in trailing prose
+    block = _first_json_object(text)
+    try:
+        return orjson.loads(block)
+    except orjson.JSONDecodeError:
+        pass
+
     # Step 4 — try fixing common issues: trailing commas, unescaped newlines
     try:
-        cleaned = re.sub(r",\s*([}\]])", r"\1", text[start:end+1])  # remove trailing commas
-        cleaned = re.sub(r"\n",          r"\\n", cleaned)             # escape newlines
-        return json.loads(cleaned)
+        cleaned = _TRAILING_COMMA_RE.sub(r"\1", block)  # remove trailing commas
+        cleaned = cleaned.replace("\n", "\\n")          # escape newlines
+        return orjson.loads(cleaned)
     except Exception:
         pass
 
@@ -257,11 +564,13 @@ def safe_str(val) -> str:
 @app.get("/health")
 def health():
     return {
-        "status":           "ok",
-        "sessions_active":  len(sessions),
-        "gemini_key_set":   bool(os.getenv("GEMINI_API_KEY")),
-        "tavily_key_set":   bool(os.getenv("TAVILY_API_KEY")),
-        "password_set":     bool(os.getenv("APP_PASSWORD")),
+        "status":             "ok",
+        "sessions_active":    len(sessions) if get_redis() is None else None,
+        "gemini_key_set":     bool(os.getenv("GEMINI_API_KEY")),
+        "tavily_key_set":     bool(os.getenv("TAVILY_API_KEY")),
+        "password_set":       bool(os.getenv("APP_PASSWORD")),
+        "redis_set":          bool(os.getenv("REDIS_URL")),
+        "session_secret_set": bool(os.getenv("SESSION_SECRET")),
     }
 
 
@@ -278,11 +587,7 @@ async def analyze(
 ):
     if not verify_password(password):
         raise HTTPException(401, "Wrong password. Access denied.")
-
-    ip = get_ip(request)
-    limited, msg = check_rate_limit(ip)
-    if limited:
-        raise HTTPException(429, msg)
+    get_session_secret()  # fail on a missing SESSION_SECRET before any quota or AI spend
 
     company         = sanitize(company,         MAX_FIELD_LENGTH)
     role            = sanitize(role,            MAX_FIELD_LENGTH)
@@ -294,41 +599,45 @@ async def analyze(
     if len(job_description) < 80:
         raise HTTPException(400, "Job description too short — paste the full JD.")
 
-    cv_bytes = await cv_file.read()
-    if len(cv_bytes) > MAX_FILE_SIZE:
-        raise HTTPException(400, "CV file exceeds 5 MB.")
-    cv_text = parse_pdf(cv_bytes, "CV")
+    ip = get_ip(request)
+    limited, msg, slot = await check_rate_limit(ip)
+    if limited:
+        raise HTTPException(429, msg)
 
-    linkedin_text = ""
-    if linkedin_file and linkedin_file.filename:
-        li_bytes = await linkedin_file.read()
-        if len(li_bytes) <= MAX_FILE_SIZE:
+    # Bad uploads shouldn't use up the user's quota
+    try:
+        cv_bytes = await read_upload(cv_file, "CV file")
+
+        li_bytes = b""
+        if linkedin_file and linkedin_file.filename:
             try:
-                linkedin_text = parse_pdf(li_bytes, "LinkedIn PDF")
+                li_bytes = await read_upload(linkedin_file, "LinkedIn PDF")
             except HTTPException:
-                linkedin_text = ""
-
-    request_log[ip].append(time.time())
-    intel         = gather_intelligence(company, role, location)
-    intel_summary = format_intel(intel)
+                li_bytes = b""
 
-    analysis_prompt = f"""You are a CV analyst and ATS specialist. Analyse this job application.
+        cv_text       = await parse_pdf_async(cv_bytes, "CV")
+        linkedin_text = await parse_pdf_async(li_bytes, "LinkedIn PDF", optional=True)
+    except HTTPException:
+        await release_rate_limit(ip, slot)
+        raise
 
-COMPANY: {company}
-ROLE: {role}
-LOCATION: {location}
+    job_description = job_description[:PROMPT_JD_CHARS]
+    cv_text         = cv_text[:PROMPT_CV_CHARS]
+    linkedin_text   = linkedin_text[:PROMPT_LI_CHARS]
 
-JOB DESCRIPTION:
-{job_description[:2500]}
+    intel_summary = await get_intel_summary(company, role, location)
 
-CANDIDATE CV:
-{cv_text[:2500]}
-
-LINKEDIN PROFILE:
-{linkedin_text[:1500] if linkedin_text else "Not provided"}
+    ctx = {
+        "company":         company,
+        "role":            role,
+        "location":        location,
+        "job_description": job_description,
+        "cv_text":         cv_text,
+        "linkedin_text":   linkedin_text,
+        "intel_summary":   intel_summary,
+    }
 
-MARKET INTELLIGENCE:
-{intel_summary[:2000]}
+    analysis_prompt = f"""You are a CV analyst and ATS specialist. Analyse the job application above.
 
 Return ONLY a JSON object with these exact keys. No text before or after the JSON:
 
@@ -356,7 +665,7 @@ Return ONLY a JSON object with these exact keys. No text before or after the JSO
 }}"""
 
     try:
-        raw      = call_ai(analysis_prompt)
+        raw      = await call_ai(build_context(ctx), analysis_prompt)
         analysis = extract_json(raw)
     except Exception as e:
         raise HTTPException(500, f"AI analysis failed: {str(e)}")
@@ -373,16 +682,7 @@ Return ONLY a JSON object with these exact keys. No text before or after the JSO
             "heads_up_tips": [],
         }
 
-    session_id = create_session({
-        "company":         company,
-        "role":            role,
-        "location":        location,
-        "job_description": job_description,
-        "cv_text":         cv_text[:3500],
-        "linkedin_text":   linkedin_text[:2500],
-        "intel_summary":   intel_summary[:3000],
-        "analysis":        analysis,
-    })
+    session_id = await create_session({**ctx, "analysis": analysis})
 
     return {
         "session_id":              session_id,
@@ -397,13 +697,11 @@ Return ONLY a JSON object with these exact keys. No text before or after the JSO
 
 @app.post("/api/generate")
 async def generate(request: Request, body: dict = Body(...)):
-    if not verify_password(body.get("password", "")):
-        raise HTTPException(401, "Wrong password.")
-
+    # No password here — the signed session token from /api/analyze is the credential
     session_id   = body.get("session_id", "")
     user_answers = body.get("user_answers", {})
 
-    ctx = get_session(session_id)
+    ctx = await get_session(session_id)
     if not ctx:
         raise HTTPException(404, "Session expired. Please start again and re-upload your CV.")
 
@@ -417,23 +715,7 @@ async def generate(request: Request, body: dict = Body(...)):
 
     banned = ', '.join(ai_words) if ai_words else "none detected"
 
-    generate_prompt = f"""You are an elite CV writer and career strategist.
-
-COMPANY: {ctx['company']}
-ROLE: {ctx['role']}
-LOCATION: {ctx['location']}
-
-JOB DESCRIPTION:
-{ctx['job_description'][:2500]}
-
-ORIGINAL CV:
-{ctx['cv_text'][:2500]}
-
-LINKEDIN PROFILE:
-{ctx['linkedin_text'][:1500] if ctx['linkedin_text'] else "Not provided"}
-
-MARKET INTELLIGENCE:
-{ctx['intel_summary'][:2000]}
+    generate_prompt = f"""You are an elite CV writer and career strategist. Rewrite the candidate CV above for this application.
 
 TOP PRIORITIES (ABC intersection):
 {abc}
@@ -478,7 +760,7 @@ Return ONLY a JSON object. No text before or after. No markdown fences:
 }}"""
 
     try:
-        raw    = call_ai(generate_prompt)
+        raw    = await call_ai(build_context(ctx), generate_prompt)
         result = extract_json(raw)
     except Exception as e:
         raise HTTPException(500, f"CV generation failed: {str(e)}")
@@ -499,7 +781,7 @@ Return ONLY a JSON object. No text before or after. No markdown fences:
         if field in result:
             result[field] = safe_str(result[field])
 
-    sessions.pop(session_id, None)
+    await delete_session(session_id)
 
     return {
         "status":             "complete",
@@ -0,0 +1,19 @@
+#!/bin/sh
+# Gunicorn + Uvicorn workers. Without REDIS_URL, sessions and rate limits live
+# in process memory, so default to a single, never-recycled worker.
+if [ -n "$REDIS_URL" ]; then
+  WORKERS="${WEB_CONCURRENCY:-$((2 * $(nproc) + 1))}"
+  MAX_REQUESTS=200
+else
+  WORKERS="${WEB_CONCURRENCY:-1}"
+  MAX_REQUESTS=0
+fi
+
+exec gunicorn main:app \
+  -k uvicorn.workers.UvicornWorker \
+  -w "$WORKERS" \
+  --bind "0.0.0.0:${PORT:-8000}" \
+  --timeout 120 \
+  --graceful-timeout 30 \
+  --max-requests "$MAX_REQUESTS" \
+  --max-requests-jitter 50
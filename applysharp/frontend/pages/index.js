@@ -466,7 +466,7 @@ function AnalyzingStage() {
 // ─────────────────────────────────────────────
 // STAGE: QUESTIONS (communication box)
 // ─────────────────────────────────────────────
-function QuestionsStage({ analysisData, password, onGenerate }) {
+function QuestionsStage({ analysisData, onGenerate }) {
   const [answers, setAnswers] = useState({})
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState('')
@@ -488,7 +488,6 @@ function QuestionsStage({ analysisData, password, onGenerate }) {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
-          password,
           session_id: analysisData.session_id,
           user_answers: answers,
         }),
@@ -925,7 +924,6 @@ export default function App() {
       {stage === STAGES.QUESTIONS && (
         <QuestionsStage
           analysisData={analysisData}
-          password={password}
           onGenerate={(data) => {
             setStage(STAGES.GENERATING)
             Promise.resolve(data).then(handleGenerate)